@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import RequestLog, BlockedIP, SuspiciousIP, IPGeolocation
+from .models import RequestLog, BlockedIP, SuspiciousIP, IPGeolocation, SecurityCounter, DailySecurityRollup
+from .stats import refresh_active_count
+from .bloom import publish_blocked_ips
+from django.core.cache import cache
 
 @admin.register(RequestLog)
 class RequestLogAdmin(admin.ModelAdmin):
@@ -18,10 +21,16 @@ class BlockedIPAdmin(admin.ModelAdmin):
     
     def activate(self, request, queryset):
         queryset.update(is_active=True)
+        refresh_active_count(BlockedIP, 'blocked_ips_count')
+        ip_addresses = list(queryset.values_list('ip_address', flat=True))
+        cache.delete_many([f"blocked_ip_{ip}" for ip in ip_addresses])
+        publish_blocked_ips(ip_addresses)
     activate.short_description = "Activate selected IP blocks"
     
     def deactivate(self, request, queryset):
         queryset.update(is_active=False)
+        refresh_active_count(BlockedIP, 'blocked_ips_count')
+        cache.delete_many([f"blocked_ip_{ip}" for ip in queryset.values_list('ip_address', flat=True)])
     deactivate.short_description = "Deactivate selected IP blocks"
 
 @admin.register(SuspiciousIP)
@@ -36,4 +45,16 @@ class IPGeolocationAdmin(admin.ModelAdmin):
     list_display = ['ip_address', 'country', 'city', 'last_updated']
     list_filter = ['country']
     search_fields = ['ip_address', 'country', 'city']
-    readonly_fields = ['last_updated']
\ No newline at end of file
+    readonly_fields = ['last_updated']
+
+@admin.register(SecurityCounter)
+class SecurityCounterAdmin(admin.ModelAdmin):
+    list_display = ['date', 'ip_address', 'kind', 'hits']
+    list_filter = ['kind', 'date']
+    search_fields = ['ip_address']
+    date_hierarchy = 'date'
+
+@admin.register(DailySecurityRollup)
+class DailySecurityRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'total_requests', 'blocked_attempts', 'rate_limited_attempts']
+    date_hierarchy = 'date'
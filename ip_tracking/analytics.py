@@ -0,0 +1,296 @@
+from django.conf import settings
+from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+from .models import RequestLog
+from .routers import analytics_reads, replica_max_lag
+import ipaddress
+import numpy as np
+import os
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SegmentsBehind(Exception):
+    """Raised when too much of the window would have to be read from the database"""
+
+SEGMENT_SUFFIX = '.npz'
+SEGMENT_FORMAT = '%Y%m%d%H'
+COLUMNS = ['ip_address', 'path', 'method', 'country', 'status_code', 'timestamp']
+
+def segment_dir():
+    default = os.path.join(str(getattr(settings, 'BASE_DIR', '.')), 'analytics_segments')
+    return getattr(settings, 'IP_TRACKING_SEGMENT_DIR', default)
+
+def floor_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+def segment_path(hour):
+    return os.path.join(segment_dir(), hour.astimezone(dt_timezone.utc).strftime(SEGMENT_FORMAT) + SEGMENT_SUFFIX)
+
+def exported_hours():
+    """Sorted UTC hours that already have a segment on disk"""
+    try:
+        names = os.listdir(segment_dir())
+    except FileNotFoundError:
+        return []
+
+    hours = []
+    for name in names:
+        if not name.endswith(SEGMENT_SUFFIX):
+            continue
+        try:
+            hour = datetime.strptime(name[:-len(SEGMENT_SUFFIX)], SEGMENT_FORMAT)
+        except ValueError:
+            continue
+        hours.append(hour.replace(tzinfo=dt_timezone.utc))
+    return sorted(hours)
+
+def watermark():
+    """End of the last exported hour, everything after it is read from the database"""
+    hours = exported_hours()
+    return hours[-1] + timedelta(hours=1) if hours else None
+
+STRING_COLUMNS = ['ip_address', 'path', 'method', 'country']
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROS_PER_DAY = 86400 * 10 ** 6
+# Stands in for a NULL country, which the ORM groups apart from ''
+NULL_STRING = '\x1f'
+
+def to_micros(value):
+    """Exact microseconds since the epoch, naive values are read in the current timezone"""
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+def _encode(strings):
+    """Dictionary-encode a sequence of strings into (values, codes)"""
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in strings), dtype=np.uint32, count=len(strings))
+    return np.array(list(index), dtype=str), codes
+
+def _empty_columns():
+    columns = {name: (np.array([], dtype=str), np.array([], dtype=np.uint32)) for name in STRING_COLUMNS}
+    columns['status_code'] = np.array([], dtype=np.int16)
+    columns['timestamp'] = np.array([], dtype=np.int64)
+    return columns
+
+def _rows_to_columns(rows):
+    if not rows:
+        return _empty_columns()
+
+    ip_address, path, method, country, status_code, timestamp = zip(*rows)
+    return {
+        'ip_address': _encode(ip_address),
+        'path': _encode(path),
+        'method': _encode(method),
+        'country': _encode([NULL_STRING if value is None else value for value in country]),
+        'status_code': np.array(status_code, dtype=np.int16),
+        'timestamp': np.fromiter((to_micros(value) for value in timestamp), dtype=np.int64, count=len(timestamp)),
+    }
+
+def _fetch_rows(start, end=None):
+    queryset = RequestLog.objects.filter(timestamp__gte=start)
+    if end is not None:
+        queryset = queryset.filter(timestamp__lt=end)
+    return list(queryset.order_by().values_list(*COLUMNS).iterator(chunk_size=5000))
+
+def write_segment(hour, columns):
+    """Write one hour of dictionary-encoded columns"""
+    arrays = {
+        'status_code': columns['status_code'],
+        'timestamp_us': columns['timestamp'],
+    }
+    for name in STRING_COLUMNS:
+        arrays[f'{name}_values'], arrays[f'{name}_codes'] = columns[name]
+
+    path = segment_path(hour)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Readers only ever see complete segments
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            np.savez_compressed(handle, **arrays)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+def _read_segment(path):
+    """Load a segment, keeping string columns as (values, codes) pairs"""
+    with np.load(path, allow_pickle=False) as data:
+        columns = {name: (data[f'{name}_values'], data[f'{name}_codes']) for name in STRING_COLUMNS}
+        columns['status_code'] = data['status_code']
+        if 'timestamp_us' in data.files:
+            columns['timestamp'] = data['timestamp_us']
+        else:
+            # Segments written before timestamps were kept in microseconds
+            columns['timestamp'] = data['timestamp'].astype(np.int64) * 10 ** 6
+    return columns
+
+def _merge(parts):
+    """Concatenate parts, remapping each part's codes onto one shared dictionary"""
+    columns = {
+        'status_code': np.concatenate([part['status_code'] for part in parts]),
+        'timestamp': np.concatenate([part['timestamp'] for part in parts]),
+    }
+    for name in STRING_COLUMNS:
+        values, inverse = np.unique(np.concatenate([part[name][0] for part in parts]), return_inverse=True)
+        codes = []
+        offset = 0
+        for part in parts:
+            part_values, part_codes = part[name]
+            remap = inverse[offset:offset + len(part_values)].astype(np.uint32)
+            codes.append(remap[part_codes] if len(part_codes) else part_codes.astype(np.uint32))
+            offset += len(part_values)
+        columns[name] = (values, np.concatenate(codes))
+    return columns
+
+def _take(columns, mask):
+    taken = {}
+    for name, column in columns.items():
+        if name in STRING_COLUMNS:
+            taken[name] = (column[0], column[1][mask])
+        else:
+            taken[name] = column[mask]
+    return taken
+
+def prune_segments(before):
+    """Delete segments for hours ending before ``before``, returns the number removed"""
+    removed = 0
+    for hour in exported_hours():
+        if hour + timedelta(hours=1) > before:
+            break
+        try:
+            os.unlink(segment_path(hour))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def settle_delay():
+    """How long after an hour ends before its rows are assumed to be complete"""
+    delay = getattr(settings, 'IP_TRACKING_SEGMENT_SETTLE_SECONDS', 300)
+    return timedelta(seconds=max(delay, replica_max_lag()))
+
+@analytics_reads()
+def export_closed_hours(now=None, max_hours=24 * 7):
+    """Export every closed hour since the watermark, returns the number written"""
+    # Queued log sinks and replica lag both deliver rows late
+    closed = floor_hour(((now or timezone.now()) - settle_delay()).astimezone(dt_timezone.utc))
+    hour = watermark()
+
+    if hour is None:
+        first = RequestLog.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+        if first is None:
+            return 0
+        hour = floor_hour(first.astimezone(dt_timezone.utc))
+
+    written = 0
+    while hour < closed and written < max_hours:
+        end = hour + timedelta(hours=1)
+        write_segment(hour, _rows_to_columns(_fetch_rows(hour, end)))
+        hour = end
+        written += 1
+    return written
+
+@analytics_reads()
+def load_columns(start, end=None):
+    """Columns for [start, end) from segments, merged with the live tail from the database"""
+    end = end or timezone.now()
+    parts = []
+
+    for hour in exported_hours():
+        if hour + timedelta(hours=1) <= start or hour >= end:
+            continue
+        parts.append(_read_segment(segment_path(hour)))
+
+    tail_start = max(start, watermark() or start)
+    # A caught-up export leaves at most the settle delay, the open hour and
+    # one missed hourly run in the database
+    if end - tail_start > settle_delay() + timedelta(hours=2):
+        raise SegmentsBehind(f"Log segments are not exported past {tail_start.isoformat()}")
+    if tail_start < end:
+        parts.append(_rows_to_columns(_fetch_rows(tail_start, end)))
+
+    if not parts:
+        return _empty_columns()
+
+    columns = _merge(parts)
+    timestamps = columns['timestamp']
+    return _take(columns, (timestamps >= to_micros(start)) & (timestamps < to_micros(end)))
+
+def filter_network(columns, network):
+    """Keep rows whose IP falls inside ``network`` (CIDR string)"""
+    network = ipaddress.ip_network(network, strict=False)
+    values, codes = columns['ip_address']
+
+    members = np.array([
+        ipaddress.ip_address(value) in network if value else False
+        for value in values
+    ], dtype=bool)
+    return _take(columns, members[codes] if len(codes) else np.zeros(0, dtype=bool))
+
+def _top(keys, counts, limit=None):
+    order = np.argsort(-counts, kind='stable')
+    order = order[counts[order] > 0]
+    if limit is not None:
+        order = order[:limit]
+    return keys[order], counts[order]
+
+def _value_counts(column, limit=None):
+    values, codes = column
+    counts = np.bincount(codes, minlength=len(values))
+    return _top(np.arange(len(values)), counts, limit)
+
+def _pair_counts(left_codes, right_codes, right_size, limit=None):
+    """Counts of (left, right) code pairs, returned as separate code arrays"""
+    combined = left_codes.astype(np.int64) * max(right_size, 1) + right_codes.astype(np.int64)
+    keys, counts = np.unique(combined, return_counts=True)
+    keys, counts = _top(keys, counts, limit)
+    return keys // max(right_size, 1), keys % max(right_size, 1), counts
+
+def requests_over_time(columns):
+    days, counts = np.unique(columns['timestamp'] // MICROS_PER_DAY, return_counts=True)
+    return [
+        {'date': (EPOCH + timedelta(days=int(day))).date(), 'count': int(count)}
+        for day, count in zip(days, counts)
+    ]
+
+def _nullable(value):
+    value = str(value)
+    return None if value == NULL_STRING else value
+
+def top_ips(columns, limit=20):
+    ip_values, ip_codes = columns['ip_address']
+    country_values, country_codes = columns['country']
+    ips, countries, counts = _pair_counts(ip_codes, country_codes, len(country_values), limit)
+    return [
+        {'ip_address': str(ip_values[ip]), 'country': _nullable(country_values[country]), 'count': int(count)}
+        for ip, country, count in zip(ips, countries, counts)
+    ]
+
+def geographic_distribution(columns):
+    values, _ = columns['country']
+    codes, counts = _value_counts(columns['country'])
+    return [
+        {'country': str(values[code]), 'count': int(count)}
+        for code, count in zip(codes, counts)
+        if values[code] not in ('', NULL_STRING)
+    ]
+
+def path_analysis(columns, limit=15):
+    values, _ = columns['path']
+    codes, counts = _value_counts(columns['path'], limit)
+    return [{'path': str(values[code]), 'count': int(count)} for code, count in zip(codes, counts)]
+
+def status_by_path(columns, limit=None):
+    path_values, path_codes = columns['path']
+    # Status codes are small non-negative ints, so they combine like codes
+    statuses, paths, counts = _pair_counts(columns['status_code'], path_codes, len(path_values), limit)
+    return [
+        {'path': str(path_values[path]), 'status_code': int(status_code), 'count': int(count)}
+        for status_code, path, count in zip(statuses, paths, counts)
+    ]
@@ -0,0 +1,247 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.utils.ipv6 import clean_ipv6_address
+from hashlib import blake2b
+import fcntl
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'IPBF'
+# magic, bit count, hash count, capacity, item count, blocklist version
+HEADER = struct.Struct('>4sQIQQQ')
+VERSION_KEY = 'ip_filter_version'
+
+def filter_path():
+    default_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return getattr(settings, 'IP_TRACKING_FILTER_PATH', os.path.join(default_dir, 'ip_tracking_blocklist.bloom'))
+
+def optimal_params(capacity, error_rate):
+    num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+    num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+    return num_bits, num_hashes
+
+def normalize_ip(ip_address):
+    """Same form GenericIPAddressField stores, so filter and exact check agree"""
+    if ':' in ip_address:
+        return clean_ipv6_address(ip_address)
+    return ip_address
+
+def bit_positions(item, num_bits, num_hashes):
+    digest = blake2b(normalize_ip(item).encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'big')
+    h2 = int.from_bytes(digest[8:], 'big') | 1
+    return [(h1 + i * h2) % num_bits for i in range(num_hashes)]
+
+def _set_bits(buffer, item, num_bits, num_hashes):
+    for position in bit_positions(item, num_bits, num_hashes):
+        buffer[HEADER.size + (position >> 3)] |= 1 << (position & 7)
+
+def current_version():
+    """Blocklist version shared by every host through the cache.
+
+    Needs the shared CACHES backend: with a per-process cache every worker
+    disagrees with the file and keeps rebuilding it.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+def bump_version():
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 1, None)
+        return cache.get(VERSION_KEY, 1)
+
+class _FileLock:
+    def __init__(self, path, blocking=True):
+        self.path = f'{path}.lock'
+        self.blocking = blocking
+        self.handle = None
+
+    def __enter__(self):
+        self.handle = open(self.path, 'a')
+        flags = fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(self.handle, flags)
+        except BlockingIOError:
+            self.handle.close()
+            self.handle = None
+        return self.handle is not None
+
+    def __exit__(self, *exc_info):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+
+def write_filter(items, version, path=None, error_rate=None):
+    """Build a filter sized for ``items`` and atomically publish it at ``path``"""
+    path = path or filter_path()
+    error_rate = error_rate or getattr(settings, 'IP_TRACKING_FILTER_ERROR_RATE', 0.001)
+    items = list(items)
+    # Leave headroom so incremental adds don't force an early rebuild
+    capacity = max(1024, len(items) * 2)
+    num_bits, num_hashes = optimal_params(capacity, error_rate)
+
+    buffer = bytearray(HEADER.size + (num_bits + 7) // 8)
+    HEADER.pack_into(buffer, 0, MAGIC, num_bits, num_hashes, capacity, len(items), version)
+    for item in items:
+        _set_bits(buffer, item, num_bits, num_hashes)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            handle.write(buffer)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+def rebuild_blocklist_filter(path=None, blocking=True):
+    """Rebuild the filter from the active blocklist, returns False if another process holds the lock"""
+    from .models import BlockedIP
+
+    path = path or filter_path()
+    with _FileLock(path, blocking) as locked:
+        if not locked:
+            return False
+        # Read the version first so a change during the build forces another rebuild
+        version = current_version()
+        items = BlockedIP.objects.filter(is_active=True).values_list('ip_address', flat=True).iterator()
+        write_filter(items, version, path)
+    logger.info(f"Rebuilt blocklist filter at version {version}")
+    return True
+
+def add_to_filter(ip_addresses, old_version, new_version, path=None):
+    """Set bits for newly blocked IPs in place, if the filter was current before the change"""
+    path = path or filter_path()
+    with _FileLock(path):
+        try:
+            handle = open(path, 'r+b')
+        except FileNotFoundError:
+            return False
+        with handle, mmap.mmap(handle.fileno(), 0) as buffer:
+            magic, num_bits, num_hashes, capacity, count, version = HEADER.unpack_from(buffer, 0)
+            if magic != MAGIC or version != old_version or count + len(ip_addresses) > capacity:
+                return False
+            for ip_address in ip_addresses:
+                _set_bits(buffer, ip_address, num_bits, num_hashes)
+            # Bits go in before the version so readers never trust a partial add
+            HEADER.pack_into(buffer, 0, magic, num_bits, num_hashes, capacity, count + len(ip_addresses), new_version)
+    return True
+
+def publish_blocked_ips(ip_addresses):
+    """Announce new blocks to every host and update the local filter in place.
+
+    Removals need no announcement: a stale positive only costs an exact check,
+    and the periodic rebuild drops it.
+    """
+    ip_addresses = list(ip_addresses)
+    if not ip_addresses:
+        return
+    new_version = bump_version()
+    if not add_to_filter(ip_addresses, new_version - 1, new_version):
+        # Readers see the version mismatch and rebuild
+        logger.info("Blocklist filter not current, left for rebuild")
+
+class SharedBlocklistFilter:
+    """Per-process read-only view of the memory-mapped blocklist filter"""
+
+    def __init__(self, path=None, check_interval=None):
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.buffer = None
+        self.inode = None
+        self.checked_at = 0
+        self.usable = False
+        self.rebuilder = None
+
+    def might_contain(self, ip_address):
+        """False means definitely not blocked, True means do the exact check"""
+        if not isinstance(ip_address, str) or not self._refresh():
+            return True
+        buffer = self.buffer
+        _, num_bits, num_hashes, _, _, _ = HEADER.unpack_from(buffer, 0)
+        try:
+            positions = bit_positions(ip_address, num_bits, num_hashes)
+        except (ValidationError, TypeError):
+            return True
+        for position in positions:
+            if not buffer[HEADER.size + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def _refresh(self):
+        interval = self.check_interval
+        if interval is None:
+            interval = getattr(settings, 'IP_TRACKING_FILTER_CHECK_INTERVAL', 1)
+        if time.monotonic() - self.checked_at < interval:
+            return self.usable
+
+        with self.lock:
+            self.checked_at = time.monotonic()
+            try:
+                self.usable = self._check()
+            except Exception as e:
+                logger.warning(f"Blocklist filter unavailable: {e}")
+                self.usable = False
+        return self.usable
+
+    def _check(self):
+        path = self.path or filter_path()
+        version = current_version()
+
+        if self._map(path) and self._version() == version:
+            return True
+        # Stale or missing, rebuilt off the request path while requests fall through
+        self._start_rebuild(path)
+        return False
+
+    def _start_rebuild(self, path):
+        if self.rebuilder is not None and self.rebuilder.is_alive():
+            return
+        self.rebuilder = threading.Thread(target=self._rebuild, args=(path,), name='blocklist-filter-rebuild', daemon=True)
+        self.rebuilder.start()
+
+    def _rebuild(self, path):
+        try:
+            # One process per host rebuilds, the rest pick up the new file on their next check
+            rebuild_blocklist_filter(path, blocking=False)
+        except Exception as e:
+            logger.warning(f"Blocklist filter rebuild failed: {e}")
+        finally:
+            connection.close()
+
+    def _map(self, path):
+        try:
+            inode = os.stat(path).st_ino
+        except FileNotFoundError:
+            return False
+        if inode != self.inode or self.buffer is None:
+            with open(path, 'rb') as handle:
+                buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            if buffer[:4] != MAGIC:
+                buffer.close()
+                return False
+            # The old mapping is left for the GC, another thread may still be reading it
+            self.buffer, self.inode = buffer, inode
+        return True
+
+    def _version(self):
+        return HEADER.unpack_from(self.buffer, 0)[5]
+
+blocklist_filter = SharedBlocklistFilter()
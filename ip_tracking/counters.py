@@ -0,0 +1,122 @@
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import RequestLog, SecurityCounter, DailySecurityRollup
+from .stats import today_key
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_FIELDS = {
+    SecurityCounter.KIND_BLOCKED: 'blocked_attempts',
+    SecurityCounter.KIND_RATE_LIMITED: 'rate_limited_attempts',
+}
+COUNTER_TIMEOUT = 60 * 60 * 72
+FOLD_BATCH_SIZE = 1000
+
+def hits_key(date, kind, ip_address):
+    return f"security_hits_{date.isoformat()}_{kind}_{ip_address}"
+
+def slots_key(date):
+    return f"security_slots_{date.isoformat()}"
+
+def slot_key(date, slot):
+    return f"security_slot_{date.isoformat()}_{slot}"
+
+FOLD_LOCK_KEY = 'security_fold_lock'
+
+def _incr(key):
+    """Atomically bump a counter, returns the new value"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, COUNTER_TIMEOUT):
+            return 1
+        return cache.incr(key)
+
+def record_hit(kind, ip_address):
+    """Count a blocked or rate-limited request, one cache INCR in the common case"""
+    date = timezone.now().date()
+    if _incr(hits_key(date, kind, ip_address)) == 1:
+        # First hit of the day for this IP, register it so the fold can find it
+        slot = _incr(slots_key(date))
+        cache.set(slot_key(date, slot), (kind, ip_address), COUNTER_TIMEOUT)
+
+def _registered_hits(date):
+    slots = cache.get(slots_key(date)) or 0
+    registered = {}
+    for start in range(1, slots + 1, FOLD_BATCH_SIZE):
+        keys = [slot_key(date, slot) for slot in range(start, min(start + FOLD_BATCH_SIZE, slots + 1))]
+        for kind, ip_address in cache.get_many(keys).values():
+            registered[hits_key(date, kind, ip_address)] = (kind, ip_address)
+    return registered
+
+def fold_security_counters(date=None, wait=0):
+    """Move the cached counts for ``date`` into SecurityCounter and DailySecurityRollup.
+
+    Returns the number of hits folded, or None if another fold held the lock
+    for longer than ``wait`` seconds.
+    """
+    date = date or timezone.now().date()
+    deadline = time.monotonic() + wait
+    # Overlapping folds would both add the same counts
+    while not cache.add(FOLD_LOCK_KEY, 1, 300):
+        if time.monotonic() >= deadline:
+            logger.warning(f"Skipped security counter fold for {date}, another fold is running")
+            return None
+        time.sleep(0.5)
+    try:
+        return _fold(date)
+    finally:
+        cache.delete(FOLD_LOCK_KEY)
+
+def total_requests(date):
+    """Logged requests on ``date``, from the stats counter when it is warm"""
+    total = cache.get(today_key(date))
+    if total is None:
+        total = RequestLog.objects.filter(timestamp__date=date).count()
+    return total
+
+def _fold(date):
+    registered = _registered_hits(date)
+
+    counts = {}
+    keys = list(registered)
+    for start in range(0, len(keys), FOLD_BATCH_SIZE):
+        counts.update(cache.get_many(keys[start:start + FOLD_BATCH_SIZE]))
+    counts = {key: count for key, count in counts.items() if count}
+
+    rollup = {}
+    with transaction.atomic():
+        for key, count in counts.items():
+            kind, ip_address = registered[key]
+            upsert_counter(SecurityCounter, {'date': date, 'ip_address': ip_address, 'kind': kind}, {'hits': count})
+            field = ROLLUP_FIELDS[kind]
+            rollup[field] = rollup.get(field, 0) + count
+        if rollup:
+            upsert_counter(DailySecurityRollup, {'date': date}, rollup)
+        # The total is a snapshot of the request counter, not a running sum
+        DailySecurityRollup.objects.update_or_create(date=date, defaults={'total_requests': total_requests(date)})
+
+    # Subtract only what was folded, hits that arrived meanwhile stay for the next run
+    for key, count in counts.items():
+        try:
+            cache.decr(key, count)
+        except ValueError:
+            logger.warning(f"Security counter {key} expired before it was folded")
+
+    return sum(counts.values())
+
+def upsert_counter(model, lookup, increments):
+    """Add ``increments`` to the counter row matching ``lookup``, creating it if needed"""
+    updates = {field: F(field) + value for field, value in increments.items()}
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **increments)
+    except IntegrityError:
+        # Another process created the row first
+        model.objects.filter(**lookup).update(**updates)
@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BOOT_SCRIPTS = {
+    'web': (
+        "import django; django.setup()\n"
+        "from django.core.wsgi import get_wsgi_application\n"
+        "get_wsgi_application()\n"
+        "from django.urls import get_resolver\n"
+        "get_resolver().url_patterns\n"
+    ),
+    'worker': (
+        "import django; django.setup()\n"
+        "from celery import current_app\n"
+        "current_app.loader.import_default_modules()\n"
+    ),
+}
+
+REPORT_SCRIPT = (
+    "import time; started = time.perf_counter()\n"
+    "{boot}"
+    "elapsed = time.perf_counter() - started\n"
+    "rss_kb = 0\n"
+    "try:\n"
+    "    with open('/proc/self/status') as status:\n"
+    "        rss_kb = next(int(line.split()[1]) for line in status if line.startswith('VmRSS:'))\n"
+    "except (OSError, StopIteration):\n"
+    "    import resource; rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+    "import json, sys; print(json.dumps({{'elapsed': elapsed, 'rss_kb': rss_kb, 'modules': len(sys.modules)}}))\n"
+)
+
+def parse_importtime(output):
+    """Cumulative microseconds per top-level import from ``python -X importtime`` stderr"""
+    totals = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented, only top-level ones are counted
+        if name.startswith('  '):
+            continue
+        module = name.strip()
+        totals[module] = totals.get(module, 0) + int(cumulative)
+    return totals
+
+class Command(BaseCommand):
+    help = 'Measure import time and RSS of a freshly booted web or Celery worker process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=['web', 'worker', 'all'], default='all', help='Process type to boot')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of fresh processes to boot per target')
+        parser.add_argument('--top', type=int, default=15, help='Number of slowest top-level imports to show')
+
+    def handle(self, *args, **options):
+        targets = ['web', 'worker'] if options['target'] == 'all' else [options['target']]
+
+        for target in targets:
+            runs = [self.boot(target) for _ in range(max(1, options['repeat']))]
+            runs = [run for run in runs if run is not None]
+            if not runs:
+                continue
+
+            elapsed = [run['elapsed'] for run in runs]
+            rss = [run['rss_kb'] for run in runs]
+            self.stdout.write(self.style.SUCCESS(
+                f"{target}: boot {statistics.median(elapsed) * 1000:.0f} ms median "
+                f"(min {min(elapsed) * 1000:.0f} ms), RSS {statistics.median(rss) / 1024:.1f} MiB, "
+                f"{runs[-1]['modules']} modules"
+            ))
+
+            imports = sorted(runs[-1]['imports'].items(), key=lambda item: item[1], reverse=True)
+            for module, cumulative in imports[:options['top']]:
+                self.stdout.write(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+    def boot(self, target):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', REPORT_SCRIPT.format(boot=BOOT_SCRIPTS[target])],
+            capture_output=True,
+            text=True,
+            env=os.environ.copy(),
+        )
+
+        if result.returncode != 0:
+            self.stdout.write(self.style.ERROR(f"{target} boot failed: {result.stderr.strip().splitlines()[-1:]}"))
+            return None
+
+        run = json.loads(result.stdout.strip().splitlines()[-1])
+        run['imports'] = parse_importtime(result.stderr)
+        return run
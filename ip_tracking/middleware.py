@@ -1,6 +1,9 @@
 from django.utils.deprecation import MiddlewareMixin
 from django.http import HttpResponseForbidden
-from .models import RequestLog, BlockedIP
+from .models import BlockedIP, SecurityCounter
+from .counters import record_hit
+from .sinks import build_event, get_log_sink
+from .bloom import blocklist_filter
 from django.core.cache import cache
 import logging
 
@@ -12,6 +15,7 @@ class IPTrackingMiddleware(MiddlewareMixin):
         
         if self.is_ip_blocked(ip_address):
             logger.warning(f"Blocked request from IP: {ip_address}")
+            record_hit(SecurityCounter.KIND_BLOCKED, ip_address)
             return HttpResponseForbidden("IP address blocked")
         
         return None
@@ -20,6 +24,8 @@ class IPTrackingMiddleware(MiddlewareMixin):
         if response.status_code < 400:  # Only log successful responses
             ip_address = self.get_client_ip(request)
             self.log_request_async(ip_address, request)
+        elif response.status_code == 429:
+            record_hit(SecurityCounter.KIND_RATE_LIMITED, self.get_client_ip(request))
         
         return response
     
@@ -34,6 +40,10 @@ class IPTrackingMiddleware(MiddlewareMixin):
     def is_ip_blocked(self, ip_address):
         if ip_address in ['127.0.0.1', 'localhost']:
             return False
+        
+        # A negative from the shared filter is definite, skip the cache round-trip
+        if not blocklist_filter.might_contain(ip_address):
+            return False
             
         cache_key = f"blocked_ip_{ip_address}"
         is_blocked = cache.get(cache_key)
@@ -46,13 +56,7 @@ class IPTrackingMiddleware(MiddlewareMixin):
     
     def log_request_async(self, ip_address, request):
         try:
-            # In production, this would be handled by Celery
-            RequestLog.objects.create(
-                ip_address=ip_address,
-                path=request.path,
-                method=request.method,
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                status_code=200
-            )
+            # Queued sinks are drained in bulk by the ingest_request_logs task
+            get_log_sink().emit(build_event(ip_address, request))
         except Exception as e:
             logger.error(f"Failed to log request: {e}")
\ No newline at end of file
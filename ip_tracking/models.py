@@ -1,24 +1,41 @@
 from django.db import models
+from django.utils import timezone
+from django.utils.ipv6 import clean_ipv6_address
+import zlib
+
+IP_BUCKETS = 256
+
+def ip_bucket(ip_address):
+    """Stable hash bucket of an IP, used to shard per-IP maintenance work"""
+    if ':' in ip_address:
+        ip_address = clean_ipv6_address(ip_address)
+    return zlib.crc32(ip_address.encode()) % IP_BUCKETS
 
 class RequestLog(models.Model):
     ip_address = models.GenericIPAddressField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     path = models.CharField(max_length=255)
     method = models.CharField(max_length=10, default='GET')
     user_agent = models.TextField(blank=True, null=True)
     country = models.CharField(max_length=100, blank=True, null=True)
     city = models.CharField(max_length=100, blank=True, null=True)
     status_code = models.IntegerField(default=200)
+    ip_bucket = models.PositiveSmallIntegerField(default=0, editable=False)
     
     class Meta:
         indexes = [
             models.Index(fields=['ip_address']),
+            models.Index(fields=['ip_bucket', 'timestamp']),
             models.Index(fields=['timestamp']),
             models.Index(fields=['path']),
             models.Index(fields=['country']),
         ]
         ordering = ['-timestamp']
     
+    def save(self, *args, **kwargs):
+        self.ip_bucket = ip_bucket(self.ip_address)
+        super().save(*args, **kwargs)
+    
     def __str__(self):
         return f"{self.ip_address} - {self.path} - {self.timestamp}"
 
@@ -66,4 +83,39 @@ class IPGeolocation(models.Model):
         verbose_name_plural = "IP Geolocations"
     
     def __str__(self):
-        return f"{self.ip_address} - {self.country}, {self.city}"
\ No newline at end of file
+        return f"{self.ip_address} - {self.country}, {self.city}"
+
+class SecurityCounter(models.Model):
+    KIND_BLOCKED = 'blocked'
+    KIND_RATE_LIMITED = 'rate_limited'
+    KIND_CHOICES = [
+        (KIND_BLOCKED, 'Blocked'),
+        (KIND_RATE_LIMITED, 'Rate limited'),
+    ]
+    
+    date = models.DateField()
+    ip_address = models.GenericIPAddressField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    hits = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = [('date', 'ip_address', 'kind')]
+        indexes = [
+            models.Index(fields=['date', 'kind']),
+        ]
+        ordering = ['-date', '-hits']
+    
+    def __str__(self):
+        return f"{self.date} - {self.ip_address} - {self.kind}: {self.hits}"
+
+class DailySecurityRollup(models.Model):
+    date = models.DateField(unique=True)
+    total_requests = models.PositiveIntegerField(default=0)
+    blocked_attempts = models.PositiveIntegerField(default=0)
+    rate_limited_attempts = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-date']
+    
+    def __str__(self):
+        return f"{self.date} - {self.total_requests} requests, {self.blocked_attempts} blocked"
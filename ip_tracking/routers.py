@@ -0,0 +1,85 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_analytics_reads = ContextVar('analytics_reads', default=False)
+_lag_checks = {}
+
+@contextmanager
+def analytics_reads():
+    """Send ORM reads inside this block to the analytics replica when it is fresh enough"""
+    token = _analytics_reads.set(True)
+    try:
+        yield
+    finally:
+        _analytics_reads.reset(token)
+
+def replica_alias():
+    alias = getattr(settings, 'IP_TRACKING_REPLICA_DATABASE', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+def replica_max_lag():
+    return getattr(settings, 'IP_TRACKING_REPLICA_MAX_LAG', 30)
+
+def replica_lag(alias):
+    """Seconds the replica is behind the primary, 0 for backends we can't ask"""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+            )
+            return float(cursor.fetchone()[0] or 0)
+        if connection.vendor == 'mysql':
+            cursor.execute("SHOW REPLICA STATUS")
+            row = cursor.fetchone()
+            if row is None:
+                return 0
+            columns = [column[0] for column in cursor.description]
+            lag = dict(zip(columns, row)).get('Seconds_Behind_Source')
+            return float('inf') if lag is None else float(lag)
+    return 0
+
+def replica_is_fresh(alias):
+    """Lag guard, the result is reused for a few seconds per process"""
+    interval = getattr(settings, 'IP_TRACKING_REPLICA_LAG_CHECK_INTERVAL', 5)
+    checked_at, fresh = _lag_checks.get(alias, (0, False))
+
+    if time.monotonic() - checked_at >= interval:
+        try:
+            fresh = replica_lag(alias) <= replica_max_lag()
+        except Exception as e:
+            logger.warning(f"Replica lag check failed for {alias}: {e}")
+            fresh = False
+        if not fresh:
+            logger.warning(f"Replica {alias} is lagging, analytics reads fall back to the primary")
+        _lag_checks[alias] = (time.monotonic(), fresh)
+
+    return fresh
+
+class AnalyticsReplicaRouter:
+    """Routes analytics reads to the replica, everything else stays on the primary"""
+
+    def db_for_read(self, model, **hints):
+        if not _analytics_reads.get():
+            return None
+
+        alias = replica_alias()
+        if alias and replica_is_fresh(alias):
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -0,0 +1,19 @@
+"""Deferred drf_yasg annotations, so drf_yasg is only imported when docs are generated"""
+
+_pending = []
+
+def lazy_swagger_auto_schema(factory):
+    """Like ``swagger_auto_schema``, but ``factory(openapi)`` builds its kwargs on first docs request"""
+    def decorator(view_method):
+        _pending.append((view_method, factory))
+        return view_method
+    return decorator
+
+def apply_swagger_overrides():
+    from drf_yasg import openapi
+    from drf_yasg.utils import swagger_auto_schema
+
+    while _pending:
+        view_method, factory = _pending.pop(0)
+        # Sets _swagger_auto_schema on the same function object the view class holds
+        swagger_auto_schema(**factory(openapi))(view_method)
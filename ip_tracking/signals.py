@@ -0,0 +1,25 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import BlockedIP, SuspiciousIP
+from .stats import refresh_active_count
+from .bloom import publish_blocked_ips
+
+@receiver([post_save, post_delete], sender=BlockedIP)
+def update_blocked_ip_count(sender, **kwargs):
+    refresh_active_count(BlockedIP, 'blocked_ips_count')
+
+@receiver([post_save, post_delete], sender=SuspiciousIP)
+def update_suspicious_ip_count(sender, **kwargs):
+    refresh_active_count(SuspiciousIP, 'suspicious_ips_count')
+
+@receiver(post_save, sender=BlockedIP)
+def publish_blocked_ip(sender, instance, **kwargs):
+    cache.delete(f"blocked_ip_{instance.ip_address}")
+    if instance.is_active:
+        transaction.on_commit(lambda: publish_blocked_ips([instance.ip_address]))
+
+@receiver(post_delete, sender=BlockedIP)
+def forget_blocked_ip(sender, instance, **kwargs):
+    cache.delete(f"blocked_ip_{instance.ip_address}")
@@ -0,0 +1,246 @@
+from celery import current_app
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+from .models import RequestLog, ip_bucket
+from .stats import record_requests
+import fcntl
+import msgpack
+import os
+import struct
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_SINK = 'ip_tracking.sinks.DatabaseSink'
+RECORD_HEADER = struct.Struct('>I')
+
+# Moves up to ARGV[1] events from the queue onto a drain's processing list
+# in one step and stamps that list in the registry with ARGV[2]
+CLAIM_SCRIPT = """
+local records = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #records > 0 then
+    redis.call('LTRIM', KEYS[1], #records, -1)
+    for start = 1, #records, 1000 do
+        redis.call('RPUSH', KEYS[2], unpack(records, start, math.min(start + 999, #records)))
+    end
+    redis.call('ZADD', KEYS[3], ARGV[2], KEYS[2])
+end
+return records
+"""
+# Puts unacknowledged events back at the head of the queue, keeping their order
+REQUEUE_SCRIPT = """
+local moved = 0
+while redis.call('RPOPLPUSH', KEYS[1], KEYS[2]) do
+    moved = moved + 1
+end
+redis.call('ZREM', KEYS[3], KEYS[1])
+return moved
+"""
+
+def build_event(ip_address, request, status_code=200):
+    """Compact, serializable form of a request log row"""
+    return {
+        'ip': ip_address,
+        'p': request.path[:255],
+        'm': request.method[:10],
+        'ua': request.META.get('HTTP_USER_AGENT', ''),
+        's': status_code,
+        't': time.time(),
+    }
+
+def _event_timestamp(value):
+    timestamp = datetime.fromtimestamp(value, dt_timezone.utc)
+    if not settings.USE_TZ:
+        timestamp = timezone.make_naive(timestamp)
+    return timestamp
+
+def write_events(events, batch_size=1000):
+    """Insert a batch of events as RequestLog rows and bump the stats counters"""
+    logs = [
+        RequestLog(
+            ip_address=event['ip'],
+            path=event['p'],
+            method=event['m'],
+            user_agent=event['ua'],
+            status_code=event['s'],
+            timestamp=_event_timestamp(event['t']),
+            # bulk_create skips save(), so the bucket is set here
+            ip_bucket=ip_bucket(event['ip']),
+        )
+        for event in events
+    ]
+    RequestLog.objects.bulk_create(logs, batch_size=batch_size)
+    # Counted once the rows are committed, a rolled back batch is retried and counted then
+    transaction.on_commit(lambda: record_requests(len(logs)))
+    return len(logs)
+
+def pack_event(event):
+    return msgpack.packb(event, use_bin_type=True)
+
+def unpack_event(data):
+    return msgpack.unpackb(data, raw=False)
+
+class DatabaseSink:
+    """Writes each event inline, the behaviour before queued sinks existed"""
+
+    def emit(self, event):
+        write_events([event])
+
+    def drain(self, write, batch_size, max_batches=None):
+        return 0
+
+class RedisSink:
+    """Pushes packed events onto a Redis list, by default on the Celery broker"""
+
+    def __init__(self, url=None, key='ip_tracking:request_logs', stale_seconds=600):
+        self.url = url or current_app.conf.broker_url
+        self.key = key
+        # Processing lists of live drains, scored by when they last claimed a batch
+        self.registry_key = f'{key}:processing'
+        self.stale_seconds = stale_seconds
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.url)
+        return self._client
+
+    def emit(self, event):
+        self.client.rpush(self.key, pack_event(event))
+
+    def requeue(self, processing_key):
+        return self.client.eval(REQUEUE_SCRIPT, 3, processing_key, self.key, self.registry_key)
+
+    def recover(self):
+        """Requeue batches of drains that died, or stalled longer than ``stale_seconds``"""
+        stale = self.client.zrangebyscore(self.registry_key, 0, time.time() - self.stale_seconds)
+        recovered = sum(self.requeue(processing_key) for processing_key in stale)
+        if recovered:
+            logger.warning(f"Requeued {recovered} request log events from stale drains")
+        return recovered
+
+    def drain(self, write, batch_size, max_batches=None):
+        """Write queued events in batches, removing each batch only after it commits"""
+        self.recover()
+        # Each drain claims onto its own list, so overlapping drains never touch each other's batch
+        processing_key = f'{self.registry_key}:{uuid.uuid4().hex}'
+
+        written = batches = 0
+        while max_batches is None or batches < max_batches:
+            records = self.client.eval(CLAIM_SCRIPT, 3, self.key, processing_key, self.registry_key, batch_size, time.time())
+            if not records:
+                break
+            try:
+                with transaction.atomic():
+                    written += write(_unpack_all(records))
+            except Exception:
+                self.requeue(processing_key)
+                raise
+            pipe = self.client.pipeline(transaction=True)
+            pipe.delete(processing_key)
+            pipe.zrem(self.registry_key, processing_key)
+            pipe.execute()
+            batches += 1
+        return written
+
+class SpoolSink:
+    """Appends length-prefixed packed events to a per-process spool file"""
+
+    def __init__(self, directory=None, grace_seconds=2):
+        default = os.path.join(str(getattr(settings, 'BASE_DIR', '.')), 'log_spool')
+        self.directory = directory or default
+        self.grace_seconds = grace_seconds
+        os.makedirs(self.directory, exist_ok=True)
+
+    def emit(self, event):
+        data = pack_event(event)
+        # Reopened per write so a rotated spool is never written to for long
+        with open(os.path.join(self.directory, f'{os.getpid()}.spool'), 'ab') as handle:
+            handle.write(RECORD_HEADER.pack(len(data)) + data)
+
+    def rotate(self):
+        stamp = time.time_ns()
+        for name in os.listdir(self.directory):
+            if name.endswith('.spool'):
+                path = os.path.join(self.directory, name)
+                try:
+                    os.replace(path, f'{path[:-len(".spool")]}.{stamp}.ingest')
+                except FileNotFoundError:
+                    # Rotated by a concurrent drain
+                    pass
+
+    def drain(self, write, batch_size, max_batches=None):
+        """Write rotated spool files, each file in one transaction and by one drainer only"""
+        # Only files rotated before the grace period are read, so writers
+        # still holding the old file open have finished with it
+        cutoff = time.time() - self.grace_seconds
+        ready = []
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith('.ingest') and os.path.getmtime(path) < cutoff:
+                    ready.append(path)
+            except FileNotFoundError:
+                pass
+        self.rotate()
+
+        written = batches = 0
+        for path in ready:
+            # Files are never split, so the limit is only checked between them
+            if max_batches is not None and batches >= max_batches:
+                break
+            try:
+                handle = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            with handle:
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                # Another drainer committed and removed it while we waited
+                if os.fstat(handle.fileno()).st_nlink == 0:
+                    continue
+                records = list(_read_records(handle))
+                with transaction.atomic():
+                    for start in range(0, len(records), batch_size):
+                        written += write(_unpack_all(records[start:start + batch_size]))
+                        batches += 1
+                # Unlinked while still locked, so no other drainer can replay it
+                os.unlink(path)
+        return written
+
+def _read_records(handle):
+    while True:
+        header = handle.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        length = RECORD_HEADER.unpack(header)[0]
+        data = handle.read(length)
+        if len(data) < length:
+            logger.warning("Truncated record at end of log spool")
+            return
+        yield data
+
+def _unpack_all(records):
+    events = []
+    for data in records:
+        try:
+            events.append(unpack_event(data))
+        except Exception as e:
+            logger.error(f"Dropping undecodable log event: {e}")
+    return events
+
+@lru_cache(maxsize=None)
+def get_log_sink():
+    path = getattr(settings, 'IP_TRACKING_LOG_SINK', DEFAULT_LOG_SINK)
+    options = getattr(settings, 'IP_TRACKING_LOG_SINK_OPTIONS', {})
+    return import_string(path)(**options)
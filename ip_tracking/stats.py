@@ -0,0 +1,99 @@
+from django.core.cache import cache
+from django.utils import timezone
+from .models import RequestLog, BlockedIP, SuspiciousIP
+import logging
+
+logger = logging.getLogger(__name__)
+
+class StatsUnavailable(Exception):
+    """Raised when the counters are cold and no snapshot exists yet"""
+
+STATS_LOCK_KEY = 'ip_stats_lock'
+STATS_SNAPSHOT_KEY = 'ip_stats_snapshot'
+STATS_LOCK_TIMEOUT = 60
+TODAY_COUNTER_TIMEOUT = 60 * 60 * 48
+
+def stats_key(name):
+    return f"ip_stats_{name}"
+
+def today_key(date=None):
+    date = date or timezone.now().date()
+    return stats_key(f"requests_{date.isoformat()}")
+
+def incr_stat(key, delta=1):
+    try:
+        cache.incr(key, delta)
+        return True
+    except ValueError:
+        # Counter has not been seeded yet, the next reconcile fills it in
+        return False
+
+def record_requests(count=1):
+    """Bump the request counters after log rows have been written"""
+    if not count:
+        return
+    incr_stat(stats_key('total_requests'), count)
+
+    key = today_key()
+    if not incr_stat(key, count):
+        # First write of the day starts a fresh counter
+        if not cache.add(key, count, TODAY_COUNTER_TIMEOUT):
+            incr_stat(key, count)
+
+def refresh_active_count(model, name):
+    """Recount active rows for one of the small blocklist tables"""
+    cache.set(stats_key(name), model.objects.filter(is_active=True).count(), None)
+
+def compute_ip_stats():
+    # Reconcile seeds counters that later INCRs build on, so it reads the primary
+    return {
+        'total_requests': RequestLog.objects.count(),
+        'blocked_ips_count': BlockedIP.objects.filter(is_active=True).count(),
+        'suspicious_ips_count': SuspiciousIP.objects.filter(is_active=True).count(),
+        'unique_countries': RequestLog.objects.exclude(country__isnull=True).exclude(country='').values('country').distinct().count(),
+        'requests_today': RequestLog.objects.filter(timestamp__date=timezone.now().date()).count(),
+    }
+
+def reconcile_ip_stats():
+    """Recompute every counter from the database and store it in the cache"""
+    stats = compute_ip_stats()
+
+    cache.set_many({
+        stats_key(name): value
+        for name, value in stats.items()
+        if name != 'requests_today'
+    }, None)
+    cache.set(today_key(), stats['requests_today'], TODAY_COUNTER_TIMEOUT)
+    # Served while a later reconcile is still running
+    cache.set(STATS_SNAPSHOT_KEY, stats, None)
+    cache.delete(STATS_LOCK_KEY)
+
+    return stats
+
+def request_reconcile():
+    """Queue one refresh_ip_stats run, later callers are ignored until it finishes"""
+    if not cache.add(STATS_LOCK_KEY, 1, STATS_LOCK_TIMEOUT):
+        return
+    try:
+        from .tasks import refresh_ip_stats
+        refresh_ip_stats.delay()
+    except Exception as e:
+        cache.delete(STATS_LOCK_KEY)
+        logger.error(f"Could not queue IP stats reconcile: {e}")
+
+def get_ip_stats():
+    """Read the running counters, a cold cache is reconciled by a task and never inline"""
+    names = ['total_requests', 'blocked_ips_count', 'suspicious_ips_count', 'unique_countries']
+    keys = {stats_key(name): name for name in names}
+    keys[today_key()] = 'requests_today'
+
+    values = cache.get_many(list(keys))
+    if len(values) == len(keys):
+        return {name: values[key] for key, name in keys.items()}
+
+    request_reconcile()
+    # Served until the reconcile has filled the counters in again
+    snapshot = cache.get(STATS_SNAPSHOT_KEY)
+    if snapshot is not None:
+        return snapshot
+    raise StatsUnavailable("IP stats are being recomputed")
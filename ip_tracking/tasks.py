@@ -1,105 +1,265 @@
-from celery import shared_task
+from celery import shared_task, chord
+from django.core.cache import cache
 from django.utils import timezone
-from datetime import timedelta
-from django.db.models import Count
+from datetime import datetime, timedelta
+from django.db import DatabaseError
+from django.db.models import Count, Sum
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
-from .models import RequestLog, SuspiciousIP, BlockedIP, IPGeolocation
-import requests
+from .models import IP_BUCKETS, RequestLog, SuspiciousIP, IPGeolocation, SecurityCounter, DailySecurityRollup
+from .stats import reconcile_ip_stats, incr_stat, stats_key
+from .counters import fold_security_counters
+import os
 import logging
 
 logger = logging.getLogger(__name__)
 
+SENSITIVE_PATHS = ['/admin/', '/login/', '/api/auth/', '/reset-password/']
+INGEST_LOCK_KEY = 'request_log_ingest_lock'
+INGEST_LOCK_TIMEOUT = 300
+
+# Shard subtasks only upsert offenders or delete a fixed slice, so a retry is safe
+SHARD_TASK_OPTIONS = {
+    'autoretry_for': (DatabaseError,),
+    'retry_backoff': True,
+    'retry_kwargs': {'max_retries': 3},
+    'acks_late': True,
+}
+
+def task_shard_count():
+    return max(1, int(getattr(settings, 'IP_TRACKING_TASK_SHARDS', os.cpu_count() or 1)))
+
+def time_slices(start, end, shards=None):
+    """Split [start, end) into equal ISO-formatted slices for shard subtasks"""
+    shards = shards or task_shard_count()
+    step = (end - start) / shards
+    bounds = [start + step * i for i in range(shards)] + [end]
+    return [(bounds[i].isoformat(), bounds[i + 1].isoformat()) for i in range(shards)]
+
+def _slice_filter(start, end):
+    return {
+        'timestamp__gte': datetime.fromisoformat(start),
+        'timestamp__lt': datetime.fromisoformat(end),
+    }
+
+def bucket_ranges(shards=None):
+    """Split the RequestLog.ip_bucket space into contiguous ranges, one per shard"""
+    shards = min(shards or task_shard_count(), IP_BUCKETS)
+    bounds = [IP_BUCKETS * i // shards for i in range(shards + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(shards)]
+
 @shared_task
 def detect_suspicious_activity():
     """Detect suspicious IP activity"""
     one_hour_ago = timezone.now() - timedelta(hours=1)
     
     try:
-        # High volume detection
-        high_volume_ips = RequestLog.objects.filter(
-            timestamp__gte=one_hour_ago
-        ).values('ip_address').annotate(
-            request_count=Count('id')
-        ).filter(request_count__gt=100)
-        
-        for ip_data in high_volume_ips:
-            ip_address = ip_data['ip_address']
-            request_count = ip_data['request_count']
-            
-            SuspiciousIP.objects.update_or_create(
-                ip_address=ip_address,
-                defaults={
-                    'reason': f'High request volume: {request_count} requests in 1 hour',
-                    'is_active': True,
-                    'request_count': request_count
-                }
-            )
-        
-        # Sensitive path access detection
-        sensitive_paths = ['/admin/', '/login/', '/api/auth/', '/reset-password/']
-        sensitive_access = RequestLog.objects.filter(
-            timestamp__gte=one_hour_ago,
-            path__in=sensitive_paths
-        ).values('ip_address').annotate(
-            access_count=Count('id')
-        ).filter(access_count__gt=10)
-        
-        for access_data in sensitive_access:
-            ip_address = access_data['ip_address']
-            access_count = access_data['access_count']
-            
-            paths_accessed = RequestLog.objects.filter(
-                ip_address=ip_address,
-                timestamp__gte=one_hour_ago,
-                path__in=sensitive_paths
-            ).values_list('path', flat=True).distinct()
-            
-            SuspiciousIP.objects.update_or_create(
-                ip_address=ip_address,
-                defaults={
-                    'reason': f'Excessive access to sensitive paths: {list(paths_accessed)}',
-                    'is_active': True,
-                    'request_count': access_count
-                }
-            )
-        
-        logger.info(f"Detected {len(high_volume_ips)} high-volume IPs and {len(sensitive_access)} suspicious access patterns")
-        return f"Detected {len(high_volume_ips) + len(sensitive_access)} suspicious activities"
-    
+        shards = [detect_activity_shard.s(low, high, one_hour_ago.isoformat()) for low, high in bucket_ranges()]
+        chord(shards)(merge_suspicious_activity.s())
+        return f"Dispatched suspicious activity detection across {len(shards)} shards"
     except Exception as e:
         logger.error(f"Anomaly detection failed: {e}")
         return f"Detection failed: {str(e)}"
 
+@shared_task(**SHARD_TASK_OPTIONS)
+def detect_activity_shard(low, high, since):
+    """Flag offenders among IPs whose bucket falls in [low, high)"""
+    # Every row of an IP lands in one bucket, so the thresholds apply per shard
+    logs = RequestLog.objects.filter(
+        ip_bucket__gte=low,
+        ip_bucket__lt=high,
+        timestamp__gte=datetime.fromisoformat(since)
+    ).order_by()
+    
+    # High volume detection
+    high_volume_ips = logs.values('ip_address').annotate(
+        request_count=Count('id')
+    ).filter(request_count__gt=100)
+    
+    for ip_data in high_volume_ips:
+        SuspiciousIP.objects.update_or_create(
+            ip_address=ip_data['ip_address'],
+            defaults={
+                'reason': f"High request volume: {ip_data['request_count']} requests in 1 hour",
+                'is_active': True,
+                'request_count': ip_data['request_count']
+            }
+        )
+    
+    # Sensitive path access detection
+    sensitive_logs = logs.filter(path__in=SENSITIVE_PATHS)
+    sensitive_access = list(sensitive_logs.values('ip_address').annotate(
+        access_count=Count('id')
+    ).filter(access_count__gt=10))
+    
+    paths_accessed = {}
+    offenders = [access_data['ip_address'] for access_data in sensitive_access]
+    for ip_address, path in sensitive_logs.filter(ip_address__in=offenders).values_list('ip_address', 'path').distinct():
+        paths_accessed.setdefault(ip_address, []).append(path)
+    
+    for access_data in sensitive_access:
+        ip_address = access_data['ip_address']
+        SuspiciousIP.objects.update_or_create(
+            ip_address=ip_address,
+            defaults={
+                'reason': f'Excessive access to sensitive paths: {sorted(paths_accessed.get(ip_address, []))}',
+                'is_active': True,
+                'request_count': access_data['access_count']
+            }
+        )
+    
+    return {'high_volume': len(high_volume_ips), 'sensitive': len(sensitive_access)}
+
+@shared_task
+def merge_suspicious_activity(shard_results):
+    high_volume = sum(result['high_volume'] for result in shard_results)
+    sensitive = sum(result['sensitive'] for result in shard_results)
+    logger.info(f"Detected {high_volume} high-volume IPs and {sensitive} suspicious access patterns")
+    return f"Detected {high_volume + sensitive} suspicious activities"
+
 @shared_task
 def cleanup_old_logs():
     """Clean up old request logs"""
     try:
         retention_days = 30
         cutoff_date = timezone.now() - timedelta(days=retention_days)
-        deleted_count = RequestLog.objects.filter(timestamp__lt=cutoff_date).delete()[0]
-        logger.info(f"Cleaned up {deleted_count} old request logs")
-        return f"Cleaned up {deleted_count} logs"
+        
+        # Exported analytics segments follow the same retention as the table
+        from .analytics import prune_segments
+        pruned = prune_segments(cutoff_date)
+        if pruned:
+            logger.info(f"Pruned {pruned} analytics segments")
+        
+        oldest = RequestLog.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+        
+        if oldest is None or oldest >= cutoff_date:
+            return "Cleaned up 0 logs"
+        
+        shards = [delete_logs_shard.s(start, end) for start, end in time_slices(oldest, cutoff_date)]
+        chord(shards)(merge_cleanup_results.s())
+        return f"Dispatched log cleanup across {len(shards)} shards"
     except Exception as e:
         logger.error(f"Log cleanup failed: {e}")
         return f"Cleanup failed: {str(e)}"
 
+@shared_task(**SHARD_TASK_OPTIONS)
+def delete_logs_shard(start, end):
+    """Delete one time slice of expired logs"""
+    deleted_count = RequestLog.objects.filter(**_slice_filter(start, end)).delete()[0]
+    incr_stat(stats_key('total_requests'), -deleted_count)
+    return deleted_count
+
+@shared_task
+def merge_cleanup_results(deleted_counts):
+    deleted_count = sum(deleted_counts)
+    logger.info(f"Cleaned up {deleted_count} old request logs")
+    return f"Cleaned up {deleted_count} logs"
+
+@shared_task
+def refresh_ip_stats():
+    """Reconcile the IP stats counters and pre-warm them for IPStatsView"""
+    try:
+        stats = reconcile_ip_stats()
+        logger.info(f"Refreshed IP stats: {stats['total_requests']} total requests")
+        return "IP stats refreshed"
+    except Exception as e:
+        logger.error(f"IP stats refresh failed: {e}")
+        return f"Stats refresh failed: {str(e)}"
+
+@shared_task
+def fold_security_counts():
+    """Fold today's cached security hit counts into the counter tables"""
+    try:
+        folded = fold_security_counters()
+        if folded is None:
+            return "Fold already running"
+        return f"Folded {folded} security hits"
+    except Exception as e:
+        logger.error(f"Security counter fold failed: {e}")
+        return f"Counter fold failed: {str(e)}"
+
+@shared_task
+def rebuild_ip_filter():
+    """Compact the blocklist filter, dropping IPs that are no longer blocked"""
+    try:
+        from .bloom import bump_version, rebuild_blocklist_filter
+        # Other hosts see the new version and rebuild their own copy
+        bump_version()
+        rebuild_blocklist_filter()
+        return "Blocklist filter rebuilt"
+    except Exception as e:
+        logger.error(f"Blocklist filter rebuild failed: {e}")
+        return f"Filter rebuild failed: {str(e)}"
+
+@shared_task
+def export_log_segments():
+    """Export closed hours of request logs to columnar segment files"""
+    try:
+        from .analytics import export_closed_hours
+        written = export_closed_hours()
+        logger.info(f"Exported {written} hourly log segments")
+        return f"Exported {written} segments"
+    except Exception as e:
+        logger.error(f"Log segment export failed: {e}")
+        return f"Export failed: {str(e)}"
+
+@shared_task
+def ingest_request_logs(batch_size=5000, max_batches=100):
+    """Drain queued log events from the configured sink into RequestLog"""
+    # Runs every few seconds, overlapping drains are safe but a slow one shouldn't queue up more
+    if not cache.add(INGEST_LOCK_KEY, 1, INGEST_LOCK_TIMEOUT):
+        return "Ingest already running"
+    try:
+        from .sinks import get_log_sink, write_events
+        ingested = get_log_sink().drain(write_events, batch_size, max_batches)
+        if ingested:
+            logger.info(f"Ingested {ingested} request logs")
+        return f"Ingested {ingested} logs"
+    except Exception as e:
+        logger.error(f"Request log ingest failed: {e}")
+        return f"Ingest failed: {str(e)}"
+    finally:
+        cache.delete(INGEST_LOCK_KEY)
+
+def build_security_report(date, trend_days=7, top_offenders=10):
+    """Assemble the daily report from the security counters and rollups"""
+    rollup = DailySecurityRollup.objects.filter(date=date).first()
+    
+    offenders = (SecurityCounter.objects.filter(date=date)
+                 .values('ip_address')
+                 .annotate(hits=Sum('hits'))
+                 .order_by('-hits')[:top_offenders])
+    
+    trend = list(DailySecurityRollup.objects.filter(
+        date__gt=date - timedelta(days=trend_days),
+        date__lte=date
+    ).order_by('date').values('date', 'total_requests', 'blocked_attempts', 'rate_limited_attempts'))
+    
+    start = datetime.combine(date, datetime.min.time(), tzinfo=timezone.now().tzinfo)
+    
+    return {
+        'total_requests': rollup.total_requests if rollup else 0,
+        'blocked_attempts': rollup.blocked_attempts if rollup else 0,
+        'rate_limited_attempts': rollup.rate_limited_attempts if rollup else 0,
+        'new_suspicious_ips': SuspiciousIP.objects.filter(
+            detected_at__gte=start,
+            detected_at__lt=start + timedelta(days=1)
+        ).count(),
+        'top_offenders': list(offenders),
+        'trend': trend,
+        'date': date.strftime('%Y-%m-%d'),
+    }
+
 @shared_task
 def send_daily_security_report():
     """Send daily security report"""
     try:
-        yesterday = timezone.now() - timedelta(days=1)
-        
-        stats = {
-            'total_requests': RequestLog.objects.filter(timestamp__gte=yesterday).count(),
-            'blocked_attempts': RequestLog.objects.filter(
-                timestamp__gte=yesterday,
-                ip_address__in=BlockedIP.objects.values_list('ip_address', flat=True)
-            ).count(),
-            'new_suspicious_ips': SuspiciousIP.objects.filter(detected_at__gte=yesterday).count(),
-            'date': timezone.now().strftime('%Y-%m-%d'),
-        }
+        date = timezone.now().date() - timedelta(days=1)
+        # Pick up hits counted since the last fold of that day
+        if fold_security_counters(date, wait=60) is None:
+            logger.warning(f"Security report for {date} may miss hits counted since the last fold")
+        stats = build_security_report(date)
         
         subject = f"Daily Security Report - {stats['date']}"
         html_message = render_to_string('emails/daily_security_report.html', {'stats': stats})
@@ -131,7 +291,8 @@ def get_ip_geolocation(ip_address):
         if cached_data:
             return cached_data
         
-        # Query external API
+        # Query external API, requests is only imported by workers that need it
+        import requests
         response = requests.get(f'http://ipapi.co/{ip_address}/json/', timeout=5)
         if response.status_code == 200:
             data = response.json()
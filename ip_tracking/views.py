@@ -2,20 +2,18 @@ from rest_framework import viewsets, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import timedelta
 from .models import RequestLog, BlockedIP, SuspiciousIP, IPGeolocation
+from .stats import get_ip_stats, StatsUnavailable
+from .routers import analytics_reads
 from .serializers import (
     RequestLogSerializer, BlockedIPSerializer, 
     SuspiciousIPSerializer, IPGeolocationSerializer,
     AnalyticsSerializer
 )
-from .tasks import detect_suspicious_activity, get_ip_geolocation, send_test_email
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
+from .schema import lazy_swagger_auto_schema
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,14 +22,14 @@ class RequestLogViewSet(viewsets.ModelViewSet):
     queryset = RequestLog.objects.all().order_by('-timestamp')
     serializer_class = RequestLogSerializer
     
-    @swagger_auto_schema(
+    @lazy_swagger_auto_schema(lambda openapi: dict(
         operation_description="Get paginated request logs with filtering",
         manual_parameters=[
             openapi.Parameter('ip', openapi.IN_QUERY, description="Filter by IP address", type=openapi.TYPE_STRING),
             openapi.Parameter('path', openapi.IN_QUERY, description="Filter by path", type=openapi.TYPE_STRING),
             openapi.Parameter('country', openapi.IN_QUERY, description="Filter by country", type=openapi.TYPE_STRING),
         ]
-    )
+    ))
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
         
@@ -56,14 +54,15 @@ class RequestLogViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
     
-    @swagger_auto_schema(
+    @lazy_swagger_auto_schema(lambda openapi: dict(
         method='get',
         operation_description="Get analytics for request logs",
         manual_parameters=[
             openapi.Parameter('days', openapi.IN_QUERY, description="Number of days to analyze", type=openapi.TYPE_INTEGER)
         ]
-    )
+    ))
     @action(detail=False, methods=['get'])
+    @analytics_reads()
     def analytics(self, request):
         days = int(request.query_params.get('days', 7))
         start_date = timezone.now() - timedelta(days=days)
@@ -95,11 +94,11 @@ class BlockedIPViewSet(viewsets.ModelViewSet):
     queryset = BlockedIP.objects.filter(is_active=True).order_by('-created_at')
     serializer_class = BlockedIPSerializer
     
-    @swagger_auto_schema(
+    @lazy_swagger_auto_schema(lambda openapi: dict(
         operation_description="Block a new IP address",
         request_body=BlockedIPSerializer,
         responses={201: BlockedIPSerializer}
-    )
+    ))
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
     
@@ -119,7 +118,7 @@ class IPGeolocationViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = IPGeolocationSerializer
 
 class IPStatsView(APIView):
-    @swagger_auto_schema(
+    @lazy_swagger_auto_schema(lambda openapi: dict(
         operation_description="Get overall IP tracking statistics",
         responses={
             200: openapi.Response(
@@ -131,40 +130,72 @@ class IPStatsView(APIView):
                         'blocked_ips_count': openapi.Schema(type=openapi.TYPE_INTEGER),
                         'suspicious_ips_count': openapi.Schema(type=openapi.TYPE_INTEGER),
                         'unique_countries': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'requests_today': openapi.Schema(type=openapi.TYPE_INTEGER),
                     }
                 )
             )
         }
-    )
-    @method_decorator(cache_page(60 * 5))
+    ))
     def get(self, request):
-        stats = {
-            'total_requests': RequestLog.objects.count(),
-            'blocked_ips_count': BlockedIP.objects.filter(is_active=True).count(),
-            'suspicious_ips_count': SuspiciousIP.objects.filter(is_active=True).count(),
-            'unique_countries': RequestLog.objects.exclude(country__isnull=True).exclude(country='').values('country').distinct().count(),
-            'requests_today': RequestLog.objects.filter(timestamp__date=timezone.now().date()).count(),
-        }
-        return Response(stats)
+        # Counters are kept current by the log write path and reconciled by refresh_ip_stats
+        try:
+            return Response(get_ip_stats())
+        except StatsUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
 class AnalyticsView(APIView):
-    @swagger_auto_schema(
+    @lazy_swagger_auto_schema(lambda openapi: dict(
         operation_description="Get comprehensive analytics",
         manual_parameters=[
-            openapi.Parameter('days', openapi.IN_QUERY, description="Number of days", type=openapi.TYPE_INTEGER)
+            openapi.Parameter('days', openapi.IN_QUERY, description="Number of days", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('engine', openapi.IN_QUERY, description="Set to 'columnar' to read exported log segments", type=openapi.TYPE_STRING),
+            openapi.Parameter('network', openapi.IN_QUERY, description="Restrict columnar queries to a CIDR range", type=openapi.TYPE_STRING),
         ]
-    )
+    ))
+    @analytics_reads()
     def get(self, request):
         days = int(request.query_params.get('days', 30))
         start_date = timezone.now() - timedelta(days=days)
         
-        analytics = {
+        if request.query_params.get('engine') == 'columnar':
+            return self.get_columnar(request, days, start_date)
+        return Response(self.get_orm_analytics(days, start_date))
+    
+    def get_orm_analytics(self, days, start_date):
+        return {
             'period': f"Last {days} days",
             'requests_over_time': self.get_requests_over_time(start_date),
             'top_ips': self.get_top_ips(start_date),
             'geographic_distribution': self.get_geographic_distribution(start_date),
             'path_analysis': self.get_path_analysis(start_date),
         }
+    
+    def get_columnar(self, request, days, start_date):
+        from . import analytics as columnar
+        
+        network = request.query_params.get('network')
+        try:
+            columns = columnar.load_columns(start_date)
+        except columnar.SegmentsBehind as e:
+            # Loading the whole window from the database would cost more than the ORM aggregates
+            if network:
+                return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            logger.info(f"Columnar analytics fell back to the ORM: {e}")
+            return Response(self.get_orm_analytics(days, start_date))
+        if network:
+            try:
+                columns = columnar.filter_network(columns, network)
+            except ValueError:
+                return Response({'error': 'Invalid network'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        analytics = {
+            'period': f"Last {days} days",
+            'requests_over_time': columnar.requests_over_time(columns),
+            'top_ips': columnar.top_ips(columns),
+            'geographic_distribution': columnar.geographic_distribution(columns),
+            'path_analysis': columnar.path_analysis(columns),
+            'status_by_path': columnar.status_by_path(columns, limit=50),
+        }
         return Response(analytics)
     
     def get_requests_over_time(self, start_date):
@@ -195,7 +226,7 @@ class AnalyticsView(APIView):
                    .order_by('-count')[:15])
 
 class IPGeolocationLookupView(APIView):
-    @swagger_auto_schema(
+    @lazy_swagger_auto_schema(lambda openapi: dict(
         operation_description="Get geolocation data for an IP address",
         responses={
             200: openapi.Response(
@@ -210,14 +241,16 @@ class IPGeolocationLookupView(APIView):
                 )
             )
         }
-    )
+    ))
     def get(self, request, ip_address):
+        from .tasks import get_ip_geolocation
+        
         geolocation_data = get_ip_geolocation.delay(ip_address)
         result = geolocation_data.get(timeout=10)
         return Response(result)
 
 class TestEmailView(APIView):
-    @swagger_auto_schema(
+    @lazy_swagger_auto_schema(lambda openapi: dict(
         operation_description="Send test email notification",
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
@@ -225,11 +258,13 @@ class TestEmailView(APIView):
                 'email': openapi.Schema(type=openapi.TYPE_STRING, description='Recipient email'),
             }
         )
-    )
+    ))
     def post(self, request):
         email = request.data.get('email')
         if not email:
             return Response({'error': 'Email address required'}, status=status.HTTP_400_BAD_REQUEST)
         
+        from .tasks import send_test_email
+        
         send_test_email.delay(email)
         return Response({'message': 'Test email sent successfully'})
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.schedules import crontab
 
 # Set the default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ip_tracking.settings')
@@ -10,6 +11,10 @@ app = Celery('ip_tracking')
 app.conf.broker_url = 'redis://localhost:6379/0'
 app.conf.result_backend = 'redis://localhost:6379/0'
 
+# Maintenance jobs fan out into shard subtasks, one per worker process
+app.conf.worker_prefetch_multiplier = 1
+app.autodiscover_tasks()
+
 app.conf.beat_schedule = {
     'detect-suspicious-activity-hourly': {
         'task': 'ip_tracking.tasks.detect_suspicious_activity',
@@ -19,4 +24,28 @@ app.conf.beat_schedule = {
         'task': 'ip_tracking.tasks.cleanup_old_logs',
         'schedule': 86400.0,
     },
+    'refresh-ip-stats': {
+        'task': 'ip_tracking.tasks.refresh_ip_stats',
+        'schedule': 300.0,
+    },
+    'export-log-segments-hourly': {
+        'task': 'ip_tracking.tasks.export_log_segments',
+        'schedule': 3600.0,
+    },
+    'ingest-request-logs': {
+        'task': 'ip_tracking.tasks.ingest_request_logs',
+        'schedule': 5.0,
+    },
+    'fold-security-counts': {
+        'task': 'ip_tracking.tasks.fold_security_counts',
+        'schedule': 60.0,
+    },
+    'rebuild-ip-filter-hourly': {
+        'task': 'ip_tracking.tasks.rebuild_ip_filter',
+        'schedule': 3600.0,
+    },
+    'send-daily-security-report': {
+        'task': 'ip_tracking.tasks.send_daily_security_report',
+        'schedule': crontab(hour=0, minute=15),
+    },
 }
\ No newline at end of file
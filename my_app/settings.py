@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+import dj_database_url
 
 # Add at the top of your settings file
 DEBUG = False
@@ -40,11 +41,47 @@ CSRF_COOKIE_SECURE = True
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
 
+# Number of shard subtasks the Celery maintenance jobs are split into
+IP_TRACKING_TASK_SHARDS = int(os.environ.get('IP_TRACKING_TASK_SHARDS', os.cpu_count() or 1))
+
 # For PythonAnywhere, we'll use SQLite for simplicity in this example
 # Comment out the MySQL config above and use this for initial deployment:
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
-}
\ No newline at end of file
+}
+
+# Optional read replica for analytics queries, see ip_tracking.routers
+if os.environ.get('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = dj_database_url.parse(
+        os.environ['REPLICA_DATABASE_URL'],
+        conn_max_age=600,
+        conn_health_checks=True,
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+else:
+    # Without a replica, analytics reads use a second connection to default,
+    # and tests under any runner get a real second alias
+    DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+
+# Shared by the web and Celery processes: stats counters, security hit
+# counts, the blocklist filter version and task locks all live here
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_CACHE_URL', 'redis://localhost:6379/1'),
+    }
+}
+
+DATABASE_ROUTERS = ['ip_tracking.routers.AnalyticsReplicaRouter']
+IP_TRACKING_REPLICA_DATABASE = 'replica'
+IP_TRACKING_REPLICA_MAX_LAG = int(os.environ.get('IP_TRACKING_REPLICA_MAX_LAG', 30))
+
+# Where the middleware sends request logs: DatabaseSink writes inline,
+# RedisSink and SpoolSink queue events for the ingest_request_logs task
+IP_TRACKING_LOG_SINK = os.environ.get('IP_TRACKING_LOG_SINK', 'ip_tracking.sinks.DatabaseSink')
+IP_TRACKING_LOG_SINK_OPTIONS = {}
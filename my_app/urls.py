@@ -1,22 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import TemplateView
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="IP Tracking API",
-        default_version='v1',
-        description="Comprehensive IP tracking and security monitoring API",
-        terms_of_service="https://www.yourapp.com/terms/",
-        contact=openapi.Contact(email="contact@yourapp.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+from .docs import lazy_docs_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -24,11 +9,11 @@ urlpatterns = [
     path('auth/', include('rest_framework.urls')),
     
     # Documentation
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
-    path('swagger.json', schema_view.without_ui(cache_timeout=0), name='schema-json'),
+    path('swagger/', lazy_docs_view('swagger'), name='schema-swagger-ui'),
+    path('redoc/', lazy_docs_view('redoc'), name='schema-redoc'),
+    path('swagger.json', lazy_docs_view(), name='schema-json'),
     
     # Health and status
     path('health/', TemplateView.as_view(template_name='health.html'), name='health-check'),
     path('', TemplateView.as_view(template_name='index.html'), name='home'),
-]
\ No newline at end of file
+]
@@ -0,0 +1,56 @@
+import tempfile
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from ip_tracking import analytics
+from ip_tracking.models import RequestLog
+
+class ColumnarAnalyticsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(IP_TRACKING_SEGMENT_DIR=self.directory.name)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.directory.cleanup()
+
+    def create_log(self, ip_address, hours_ago=0, **fields):
+        log = RequestLog.objects.create(ip_address=ip_address, path='/test/', **fields)
+        if hours_ago:
+            RequestLog.objects.filter(pk=log.pk).update(timestamp=timezone.now() - timedelta(hours=hours_ago))
+        return log
+
+    def test_export_log_segments_matches_orm(self):
+        self.create_log('10.1.2.3', hours_ago=3)
+        self.create_log('192.168.1.1')
+
+        self.assertGreater(analytics.export_closed_hours(), 0)
+        columns = analytics.load_columns(timezone.now() - timedelta(days=1))
+        self.assertEqual(analytics.path_analysis(columns), [{'path': '/test/', 'count': 2}])
+
+        in_range = analytics.filter_network(columns, '10.0.0.0/8')
+        self.assertEqual(len(in_range['timestamp']), 1)
+        self.assertEqual(analytics.top_ips(in_range), [{'ip_address': '10.1.2.3', 'country': None, 'count': 1}])
+
+        self.assertGreater(analytics.prune_segments(timezone.now()), 0)
+        self.assertEqual(analytics.exported_hours(), [])
+
+    def test_null_and_empty_countries_stay_apart(self):
+        for _ in range(3):
+            self.create_log('10.1.2.3', hours_ago=3)
+        for _ in range(2):
+            self.create_log('10.1.2.3', hours_ago=3, country='')
+
+        analytics.export_closed_hours()
+        columns = analytics.load_columns(timezone.now() - timedelta(days=1))
+        self.assertEqual(analytics.top_ips(columns), [
+            {'ip_address': '10.1.2.3', 'country': None, 'count': 3},
+            {'ip_address': '10.1.2.3', 'country': '', 'count': 2},
+        ])
+        self.assertEqual(analytics.geographic_distribution(columns), [])
+
+    def test_unexported_window_is_not_loaded_from_the_database(self):
+        self.create_log('10.1.2.3', hours_ago=48)
+        with self.assertRaises(analytics.SegmentsBehind):
+            analytics.load_columns(timezone.now() - timedelta(days=30))
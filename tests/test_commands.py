@@ -0,0 +1,12 @@
+from django.test import SimpleTestCase
+from ip_tracking.management.commands.measure_startup import parse_importtime
+
+class MeasureStartupTests(SimpleTestCase):
+    def test_parse_importtime_counts_top_level_imports(self):
+        output = "\n".join([
+            "import time: self [us] | cumulative | imported package",
+            "import time:       120 |        120 |     drf_yasg.openapi",
+            "import time:       300 |        420 | drf_yasg",
+            "import time:        50 |         50 | json",
+        ])
+        self.assertEqual(parse_importtime(output), {'drf_yasg': 420, 'json': 50})
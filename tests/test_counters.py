@@ -0,0 +1,28 @@
+from datetime import timedelta
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from ip_tracking.counters import fold_security_counters, record_hit
+from ip_tracking.models import RequestLog, SecurityCounter
+from ip_tracking.tasks import build_security_report
+
+class SecurityCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_security_report_built_from_counters(self):
+        RequestLog.objects.create(ip_address='10.0.0.3', path='/', method='GET')
+        for _ in range(3):
+            record_hit(SecurityCounter.KIND_BLOCKED, '10.0.0.1')
+        record_hit(SecurityCounter.KIND_RATE_LIMITED, '10.0.0.2')
+        self.assertEqual(fold_security_counters(), 4)
+        # Folded counts are subtracted, so a second fold adds nothing
+        self.assertEqual(fold_security_counters(), 0)
+
+        stats = build_security_report(timezone.now().date())
+        self.assertEqual(stats['blocked_attempts'], 3)
+        self.assertEqual(stats['rate_limited_attempts'], 1)
+        self.assertEqual(stats['total_requests'], 1)
+        self.assertEqual(stats['top_offenders'][0], {'ip_address': '10.0.0.1', 'hits': 3})
+        self.assertEqual(build_security_report(timezone.now().date() - timedelta(days=1))['blocked_attempts'], 0)
+
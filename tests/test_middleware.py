@@ -0,0 +1,82 @@
+import os
+import tempfile
+from unittest import mock
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from ip_tracking.bloom import SharedBlocklistFilter, add_to_filter, current_version, rebuild_blocklist_filter, write_filter
+from ip_tracking.middleware import IPTrackingMiddleware
+from ip_tracking.models import BlockedIP
+
+class BlocklistFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'blocklist.bloom')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_filter_has_no_false_negatives(self):
+        blocked = [f'10.0.{i // 256}.{i % 256}' for i in range(500)]
+        write_filter(blocked, current_version(), self.path)
+
+        shared = SharedBlocklistFilter(self.path, check_interval=0)
+        self.assertTrue(all(shared.might_contain(ip) for ip in blocked))
+        self.assertFalse(shared.might_contain('192.168.1.1'))
+
+    def test_incremental_add_is_visible_to_readers(self):
+        version = current_version()
+        write_filter([], version, self.path)
+        shared = SharedBlocklistFilter(self.path, check_interval=0)
+        self.assertFalse(shared.might_contain('172.16.0.9'))
+
+        cache.set('ip_filter_version', version + 1, None)
+        self.assertTrue(add_to_filter(['172.16.0.9'], version, version + 1, self.path))
+        self.assertTrue(shared.might_contain('172.16.0.9'))
+
+    def test_stale_filter_falls_through_without_inline_rebuild(self):
+        version = current_version()
+        write_filter([], version, self.path)
+        cache.set('ip_filter_version', version + 1, None)
+
+        shared = SharedBlocklistFilter(self.path, check_interval=0)
+        with mock.patch.object(SharedBlocklistFilter, '_start_rebuild') as start_rebuild:
+            self.assertTrue(shared.might_contain('192.168.1.1'))
+        start_rebuild.assert_called_once_with(self.path)
+
+    def test_missing_ip_falls_through(self):
+        write_filter([], current_version(), self.path)
+        shared = SharedBlocklistFilter(self.path, check_interval=0)
+        self.assertTrue(shared.might_contain(None))
+
+class MiddlewareBlocklistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'blocklist.bloom')
+        BlockedIP.objects.create(ip_address='10.9.9.9', reason='Test blocking')
+        rebuild_blocklist_filter(self.path)
+
+        shared = SharedBlocklistFilter(self.path, check_interval=0)
+        patcher = mock.patch('ip_tracking.middleware.blocklist_filter', shared)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.middleware = IPTrackingMiddleware(lambda request: None)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_blocked_ip_is_rejected(self):
+        self.assertTrue(self.middleware.is_ip_blocked('10.9.9.9'))
+        request = RequestFactory().get('/', REMOTE_ADDR='10.9.9.9')
+        self.assertEqual(self.middleware.process_request(request).status_code, 403)
+
+    def test_clean_ip_skips_cache_and_database(self):
+        with self.assertNumQueries(0), mock.patch('ip_tracking.middleware.cache') as middleware_cache:
+            self.assertFalse(self.middleware.is_ip_blocked('192.168.1.1'))
+        middleware_cache.get.assert_not_called()
+
+    def test_request_without_client_ip_is_not_an_error(self):
+        request = RequestFactory().get('/')
+        del request.META['REMOTE_ADDR']
+        self.assertIsNone(self.middleware.process_request(request))
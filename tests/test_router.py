@@ -0,0 +1,42 @@
+from unittest import mock
+from datetime import timedelta
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from ip_tracking.models import RequestLog
+from ip_tracking import routers
+from ip_tracking.analytics import load_columns
+from ip_tracking.routers import AnalyticsReplicaRouter, analytics_reads
+from ip_tracking.stats import compute_ip_stats
+
+@override_settings(IP_TRACKING_REPLICA_DATABASE='replica', IP_TRACKING_REPLICA_LAG_CHECK_INTERVAL=0)
+class RouterTests(TestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.router = AnalyticsReplicaRouter()
+        routers._lag_checks.clear()
+
+    def test_reads_stay_on_primary_outside_analytics(self):
+        self.assertIsNone(self.router.db_for_read(RequestLog))
+
+    def test_analytics_reads_use_replica(self):
+        with analytics_reads():
+            self.assertEqual(self.router.db_for_read(RequestLog), 'replica')
+            self.assertEqual(self.router.db_for_write(RequestLog), 'default')
+
+    def test_analytics_query_runs_on_replica(self):
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            load_columns(timezone.now() - timedelta(hours=1))
+        self.assertTrue(any('ip_tracking_requestlog' in query['sql'] for query in replica_queries))
+
+    def test_stats_reconcile_reads_primary(self):
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            compute_ip_stats()
+        self.assertEqual(len(replica_queries), 0)
+
+    @mock.patch('ip_tracking.routers.replica_lag', return_value=600)
+    def test_lagging_replica_falls_back_to_primary(self, replica_lag):
+        with analytics_reads():
+            self.assertIsNone(self.router.db_for_read(RequestLog))
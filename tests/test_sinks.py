@@ -0,0 +1,61 @@
+import tempfile
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from ip_tracking.models import RequestLog
+from ip_tracking.sinks import SpoolSink, build_event, write_events
+from ip_tracking.stats import today_key
+
+class SpoolSinkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.sink = SpoolSink(self.directory.name, grace_seconds=0)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def emit(self, path, count):
+        request = RequestFactory().get(path)
+        for _ in range(count):
+            self.sink.emit(build_event('10.0.0.5', request))
+
+    def test_spool_sink_ingests_in_bulk(self):
+        self.emit('/spooled/', 3)
+
+        self.assertEqual(self.sink.drain(write_events, 100), 0)
+        # A file is never split, so a batch limit still ingests all of it
+        self.assertEqual(self.sink.drain(write_events, 2, max_batches=1), 3)
+        self.assertEqual(self.sink.drain(write_events, 2), 0)
+        self.assertEqual(RequestLog.objects.filter(path='/spooled/').count(), 3)
+
+    def test_spool_sink_keeps_file_when_write_fails(self):
+        def failing_write(events):
+            write_events(events)
+            raise RuntimeError("database went away")
+
+        self.emit('/retried/', 5)
+        self.sink.drain(write_events, 100)
+
+        with self.assertRaises(RuntimeError):
+            self.sink.drain(failing_write, 2)
+        self.assertEqual(RequestLog.objects.filter(path='/retried/').count(), 0)
+        self.assertEqual(self.sink.drain(write_events, 2), 5)
+        self.assertEqual(RequestLog.objects.filter(path='/retried/').count(), 5)
+
+    def test_requests_counted_only_for_committed_batches(self):
+        def failing_write(events):
+            write_events(events)
+            raise RuntimeError("database went away")
+
+        cache.set(today_key(), 0)
+        self.emit('/counted/', 4)
+        self.sink.drain(write_events, 100)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError):
+                self.sink.drain(failing_write, 100)
+        self.assertEqual(cache.get(today_key()), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sink.drain(write_events, 100)
+        self.assertEqual(cache.get(today_key()), 4)
@@ -0,0 +1,20 @@
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase
+from ip_tracking.stats import get_ip_stats, stats_key
+from ip_tracking.tasks import refresh_ip_stats
+
+class StatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch('ip_tracking.tasks.refresh_ip_stats.delay')
+    def test_get_ip_stats_serves_snapshot_while_reconciling(self, delay):
+        refresh_ip_stats()
+        cache.delete(stats_key('total_requests'))
+
+        with self.assertNumQueries(0):
+            stats = get_ip_stats()
+        self.assertEqual(stats['total_requests'], 0)
+        delay.assert_called_once_with()
+
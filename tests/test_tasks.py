@@ -0,0 +1,34 @@
+from datetime import timedelta
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from ip_tracking.models import RequestLog, BlockedIP, SuspiciousIP
+from ip_tracking.stats import get_ip_stats, record_requests
+from ip_tracking.tasks import bucket_ranges, detect_activity_shard, refresh_ip_stats
+
+class TaskTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_refresh_ip_stats_warms_counters(self):
+        RequestLog.objects.create(ip_address='192.168.1.1', path='/test/')
+        BlockedIP.objects.create(ip_address='10.0.0.1', reason='Test blocking')
+        refresh_ip_stats()
+
+        record_requests()
+        stats = get_ip_stats()
+        self.assertEqual(stats['total_requests'], 2)
+        self.assertEqual(stats['requests_today'], 2)
+        self.assertEqual(stats['blocked_ips_count'], 1)
+
+    def test_detect_activity_shards_flag_offenders(self):
+        for _ in range(101):
+            RequestLog.objects.create(ip_address='10.0.0.2', path='/test/')
+        for _ in range(5):
+            RequestLog.objects.create(ip_address='10.0.0.3', path='/test/')
+
+        since = (timezone.now() - timedelta(hours=1)).isoformat()
+        results = [detect_activity_shard(low, high, since) for low, high in bucket_ranges(4)]
+        self.assertEqual(sum(result['high_volume'] for result in results), 1)
+        self.assertEqual(SuspiciousIP.objects.get(ip_address='10.0.0.2').request_count, 101)
+        self.assertFalse(SuspiciousIP.objects.filter(ip_address='10.0.0.3').exists())
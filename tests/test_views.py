@@ -1,15 +1,57 @@
-from django.test import TestCase
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
+from ip_tracking.analytics import export_closed_hours
+from ip_tracking.models import RequestLog
+from ip_tracking.tasks import refresh_ip_stats
 
 class ViewTests(TestCase):
     def setUp(self):
         self.client = APIClient()
+        cache.clear()
     
     def test_swagger_docs(self):
         response = self.client.get('/swagger/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
     
     def test_api_stats(self):
+        refresh_ip_stats()
         response = self.client.get('/api/stats/')
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @mock.patch('ip_tracking.tasks.refresh_ip_stats.delay')
+    def test_api_stats_cold_cache_queues_reconcile(self, delay):
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/stats/')
+            self.client.get('/api/stats/')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        delay.assert_called_once_with()
+
+    def test_columnar_analytics_matches_orm(self):
+        for country in [None, None, None, '', '']:
+            log = RequestLog.objects.create(ip_address='10.1.2.3', path='/test/', country=country)
+            RequestLog.objects.filter(pk=log.pk).update(timestamp=timezone.now() - timedelta(hours=3))
+        RequestLog.objects.create(ip_address='10.1.2.3', path='/test/', country='Kenya')
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(IP_TRACKING_SEGMENT_DIR=directory):
+            export_closed_hours()
+            columnar = self.client.get('/api/analytics/', {'days': 1, 'engine': 'columnar'})
+            orm = self.client.get('/api/analytics/', {'days': 1})
+
+        self.assertEqual(columnar.status_code, status.HTTP_200_OK)
+        self.assertIn('status_by_path', columnar.data)
+        # The views log their own requests, so only the seeded IP is compared
+        seeded = lambda rows: [dict(row) for row in rows if row['ip_address'] == '10.1.2.3']
+        self.assertEqual(seeded(columnar.data['top_ips']), seeded(orm.data['top_ips']))
+        self.assertEqual(len(seeded(columnar.data['top_ips'])), 3)
+
+    def test_columnar_analytics_falls_back_to_orm_before_export(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(IP_TRACKING_SEGMENT_DIR=directory):
+            response = self.client.get('/api/analytics/', {'days': 30, 'engine': 'columnar'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('status_by_path', response.data)